@@ -1,41 +1,225 @@
 # app.py - Main Flask application
 from flask import Flask, render_template, request, jsonify, session, send_file
-import pandas as pd
 import os
 import uuid
 from werkzeug.utils import secure_filename
 import tempfile
 import json
-from datetime import datetime
+from datetime import datetime, date
 import io
-import openpyxl
+import re
+import itertools
+import hashlib
+import pickle
+import python_calamine
+import xlsxwriter
+from collections import defaultdict
+from operator import itemgetter
 
 # Use os.path.join for better cross-platform compatibility
 app = Flask(__name__, template_folder=os.path.join('..', 'templates'))
 app.secret_key = 'your-secret-key-change-this'  # Change this in production
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 
-# Global storage for workbook data (in production, use Redis or database)
+# Workbook data per session. With REDIS_URL set it lives in Redis, so several
+# worker processes share it and entries expire; otherwise it is kept in this process
+REDIS_URL = os.environ.get('REDIS_URL')
+WORKBOOK_TTL = 3600  # seconds without use before a session's workbook is dropped from Redis
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(REDIS_URL)
+else:
+    redis_client = None
 workbook_storage = {}
 
+# Parsed workbooks are cached on disk by content hash, so re-uploading or
+# re-searching the same file skips Excel parsing entirely
+CACHE_DIR = os.path.join(app.root_path, '..', 'cache')
+CACHE_VERSION = 3  # Bump whenever the format of cached objects changes
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # Least recently used entries are removed above this
+
+# CSID separators, compiled once: any whitespace/comma/semicolon for bulk input,
+# only commas/semicolons/newlines for the IP search (CSIDs there may contain spaces)
+CSID_SPLIT_RE = re.compile(r'[\s,;\n\t]+')
+CSID_LIST_SPLIT_RE = re.compile(r'[,;\n\r]+')
+
+# Each session stores two parts: 'wb' (sheet list + CSID index, used by the CO
+# page) and 'rows' (ODP/IP/CSID rows, used by the ODP and IP pages), kept apart
+# so a CSID lookup never has to load the rows
+WORKBOOK_PARTS = ('wb', 'rows')
+
+def store_workbook(session_id, value, part='wb'):
+    """Save one part of a session's workbook data"""
+    key = f'{part}:{session_id}'
+    if redis_client is not None:
+        redis_client.setex(key, WORKBOOK_TTL, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    else:
+        workbook_storage[key] = value
+
+def load_workbook(session_id, part='wb'):
+    """Return one part of a session's workbook data, or None if nothing is loaded"""
+    if session_id is None:
+        return None
+    key = f'{part}:{session_id}'
+    if redis_client is not None:
+        # Sliding expiry: any read keeps all parts of the session alive together
+        with redis_client.pipeline() as pipe:
+            pipe.get(key)
+            for part_name in WORKBOOK_PARTS:
+                pipe.expire(f'{part_name}:{session_id}', WORKBOOK_TTL)
+            payload = pipe.execute()[0]
+        return pickle.loads(payload) if payload is not None else None
+    return workbook_storage.get(key)
+
+def drop_workbook(session_id):
+    """Forget all of a session's workbook data"""
+    keys = [f'{part}:{session_id}' for part in WORKBOOK_PARTS]
+    if redis_client is not None:
+        redis_client.delete(*keys)
+    else:
+        for key in keys:
+            workbook_storage.pop(key, None)
+
 def find_in_all_sheets(session_id, search_value):
     """Find search value in all sheets for a specific session"""
-    if session_id not in workbook_storage:
+    wb_info = load_workbook(session_id)
+    if wb_info is None:
         return "No data loaded"
     
-    workbook_data = workbook_storage[session_id]['data']
-    found_sheets = []
-    search_str = str(search_value)
-    
-    for sheet_name, column_data in workbook_data.items():
-        str_data = [str(val) for val in column_data if str(val) != 'nan']
-        if search_str in str_data:
-            found_sheets.append(sheet_name)
-    
-    if found_sheets:
-        return ", ".join(found_sheets)
-    else:
-        return "Not Found"
+    # Single hash probe into the index built at upload time
+    return wb_info['index'].get(str(search_value), "Not Found")
+
+def find_bulk_in_all_sheets(session_id, search_values):
+    """Find many search values in one pass; returns {search_value: found_sheets}"""
+    wb_info = load_workbook(session_id)
+    if wb_info is None:
+        return {value: "No data loaded" for value in search_values}
+    
+    index = wb_info['index']
+    results = {}
+    for value in set(search_values):  # Each distinct value is looked up once
+        results[value] = index.get(str(value), "Not Found")
+    return results
+
+def cell_value(value):
+    """Normalise a calamine cell to what openpyxl/pandas used to return"""
+    # Calamine reports every number as float; give whole numbers back as int
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    # Date-only cells come back as date; openpyxl gave a midnight datetime,
+    # so keep that (it stringifies as '2024-01-02 00:00:00' in the index)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+def file_hash(raw):
+    """Content hash of an uploaded file, used as its cache key"""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+def cache_path(key):
+    """Cache file for key; the format version is part of the name"""
+    return os.path.join(CACHE_DIR, f'{key}-v{CACHE_VERSION}.pkl')
+
+def cache_load(key):
+    """Return the cached object for key, or None if it is not cached"""
+    path = cache_path(key)
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+    except Exception:  # Missing, corrupt or unreadable entry: parse instead
+        return None
+    try:
+        os.utime(path)  # Mark as recently used for prune_cache
+    except OSError:  # e.g. read-only cache dir; the entry is still good
+        pass
+    return value
+
+def cache_save(key, value):
+    """Store value under key; a failed cache write never fails the request"""
+    tmp_name = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=CACHE_DIR, suffix='.tmp', delete=False) as f:
+            tmp_name = f.name
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_name, cache_path(key))
+        tmp_name = None
+        prune_cache()
+    except Exception:
+        if tmp_name is not None:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+
+def prune_cache():
+    """Drop entries of other format versions, then the least recently used ones over CACHE_MAX_BYTES"""
+    current = f'-v{CACHE_VERSION}.pkl'
+    entries = []
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if not entry.name.endswith('.pkl'):
+                continue
+            try:
+                if not entry.name.endswith(current):
+                    os.remove(entry.path)
+                    continue
+                stat = entry.stat()
+            except OSError:  # Removed by another worker meanwhile
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+def parse_workbook(raw):
+    """Parse every sheet once and return (sheet_names, index, track rows)"""
+    index = defaultdict(list)  # value -> list of sheets containing it
+    rows = []  # (sheet_name, odp, ip, csid) outside the TRACK ODP sheet
+    seen = {}  # One shared string object per distinct CSID, freed with the index
+    
+    # Open the workbook once (shared strings are parsed once) and walk
+    # columns B-D of each sheet in one pass
+    with python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(raw)) as wb:
+        sheet_names = wb.sheet_names
+        for sheet_name in sheet_names:
+            sheet_rows = wb.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False)
+            column_d = set()
+            for row in itertools.islice(sheet_rows, 1, None):  # Skip header row, no copy
+                if len(row) < 4:  # Column D does not exist
+                    break
+                odp, ip, csid = cell_value(row[1]), cell_value(row[2]), cell_value(row[3])
+                if csid != '':  # Blank cells are dropped here, once
+                    # Repeats across sheets share one string object
+                    csid_str = str(csid)
+                    column_d.add(seen.setdefault(csid_str, csid_str))
+                if sheet_name != "TRACK ODP":
+                    rows.append((sheet_name, odp, ip, csid))
+            for value in column_d:
+                index[value].append(sheet_name)
+    
+    # Cache the final "Sheet1, Sheet2" answer so lookups never join
+    index = {value: ", ".join(sheets) for value, sheets in index.items()}
+    
+    # Index the rows by stripped ODP and CSID so each search is a dict lookup
+    # instead of a scan over every row
+    by_odp = defaultdict(list)  # odp -> row numbers, in sheet order
+    by_csid = {}  # csid -> row number; a later row with the same CSID wins
+    for row_num, (sheet_name, odp, ip, csid) in enumerate(rows):
+        if odp:
+            by_odp[str(odp).strip()].append(row_num)
+        if csid:
+            by_csid[str(csid).strip()] = row_num
+    track = {'rows': rows, 'by_odp': dict(by_odp), 'by_csid': by_csid}
+    return sheet_names, index, track
 
 @app.route('/')
 def index():
@@ -58,29 +242,29 @@ def upload_file():
         return jsonify({'error': 'Please upload an Excel file (.xlsx or .xls)'}), 400
     
     try:
-        # Read Excel file
-        workbook_data = {}
-        with pd.ExcelFile(file) as xls:
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-                if len(df.columns) >= 4:  # Check if column D exists
-                    column_d = df.iloc[:, 3].astype(str).dropna()  # Column D (index 3)
-                    workbook_data[sheet_name] = column_d.tolist()
-                else:
-                    workbook_data[sheet_name] = []
+        # Read Excel file once; only parse it if this exact file is not cached
+        raw = file.read()
+        digest = file_hash(raw)
+        parsed = cache_load(digest)
+        if parsed is None:
+            parsed = parse_workbook(raw)
+            cache_save(digest, parsed)
+        sheet_names, index, track = parsed
         
-        # Store in session storage
-        session_id = session['session_id']
-        workbook_storage[session_id] = {
-            'data': workbook_data,
+        # Store in session storage; the ODP/IP searches reuse the rows
+        session_id = session.setdefault('session_id', str(uuid.uuid4()))
+        store_workbook(session_id, track, part='rows')
+        store_workbook(session_id, {
+            'sheets': sheet_names,
+            'index': index,
             'filename': secure_filename(file.filename),
             'upload_time': datetime.now().isoformat()
-        }
+        })
         
         return jsonify({
             'success': True,
-            'message': f'Loaded data from {len(workbook_data)} sheets',
-            'sheets': list(workbook_data.keys())
+            'message': f'Loaded data from {len(sheet_names)} sheets',
+            'sheets': sheet_names
         })
         
     except Exception as e:
@@ -115,22 +299,15 @@ def add_bulk_csids():
         return jsonify({'error': 'No CSIDs provided'}), 400
     
     # Parse CSIDs
-    import re
-    csids = re.split(r'[\s,;\n\t]+', csids_text)
+    csids = CSID_SPLIT_RE.split(csids_text)
     csids = [csid.strip() for csid in csids if csid.strip()]
     
     if not csids:
         return jsonify({'error': 'No valid CSIDs found'}), 400
     
     session_id = session['session_id']
-    results = []
-    
-    for csid in csids:
-        found_sheets = find_in_all_sheets(session_id, csid)
-        results.append({
-            'csid': csid,
-            'found_sheets': found_sheets
-        })
+    found = find_bulk_in_all_sheets(session_id, csids)
+    results = [{'csid': csid, 'found_sheets': found[csid]} for csid in csids]
     
     return jsonify({
         'success': True,
@@ -148,14 +325,8 @@ def refresh_csids():
         return jsonify({'error': 'No CSIDs to refresh'}), 400
     
     session_id = session['session_id']
-    results = []
-    
-    for csid in csids:
-        found_sheets = find_in_all_sheets(session_id, csid)
-        results.append({
-            'csid': csid,
-            'found_sheets': found_sheets
-        })
+    found = find_bulk_in_all_sheets(session_id, csids)
+    results = [{'csid': csid, 'found_sheets': found[csid]} for csid in csids]
     
     return jsonify({
         'success': True,
@@ -172,13 +343,19 @@ def export_data():
         return jsonify({'error': 'No data to export'}), 400
     
     try:
-        # Create DataFrame
-        df = pd.DataFrame(export_data)
+        # Columns in first-seen order across all rows
+        columns = list(dict.fromkeys(key for row in export_data for key in row))
         
-        # Create Excel file in memory
+        # Write rows straight into the Excel file in memory, one row at a time
         output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='CSID_Results')
+        wb = xlsxwriter.Workbook(output, {'constant_memory': True})
+        ws = wb.add_worksheet('CSID_Results')
+        # Same header style pandas used to apply
+        header_format = wb.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        ws.write_row(0, 0, columns, header_format)
+        for row_num, row in enumerate(export_data, 1):
+            ws.write_row(row_num, 0, [row.get(col) for col in columns])
+        wb.close()
         
         output.seek(0)
         
@@ -197,12 +374,12 @@ def get_status():
     """Get current session status"""
     session_id = session.get('session_id')
     
-    if session_id in workbook_storage:
-        wb_info = workbook_storage[session_id]
+    wb_info = load_workbook(session_id)
+    if wb_info is not None:
         return jsonify({
             'loaded': True,
             'filename': wb_info['filename'],
-            'sheets': list(wb_info['data'].keys()),
+            'sheets': wb_info['sheets'],
             'upload_time': wb_info['upload_time']
         })
     else:
@@ -223,61 +400,59 @@ def track_ip () :
 #script buat tracking-odp.html
 @app.route('/search-odp', methods=['POST'])
 def search_odp():
-    odp_id = request.form.get('odp_id')
-    file = request.files['file']
+    data = request.get_json()
+    odp_id = data.get('odp_id', '').strip()
+    
+    track = load_workbook(session.get('session_id'), part='rows')
+    if track is None:
+        return jsonify({'error': 'Please upload an Excel file first'}), 400
     
-    wb = openpyxl.load_workbook(file)
     results = []
+    rows = track['rows']
     
-    for sheet_name in wb.sheetnames:
-        if sheet_name == "TRACK ODP":
-            continue
-        ws = wb[sheet_name]
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[1] and str(row[1]).strip() == odp_id.strip():
-                results.append({
-                    'ip': row[2],
-                    'csid': row[3]
-                })
+    for row_num in track['by_odp'].get(odp_id, []):
+        sheet_name, row_odp, row_ip, row_csid = rows[row_num]
+        results.append({
+            'ip': row_ip,
+            'csid': row_csid
+        })
     
     return jsonify(results)
 
 #script buat tracking-ip.html
 @app.route('/search-ip', methods=['POST'])
 def search_ip():
-    csid_input = request.form.get('csid')
-    file = request.files['file']
+    data = request.get_json()
+    csid_input = data.get('csid')
     
     # Parse multiple CSIDs - split by newlines, commas, or semicolons
     csids = []
     if csid_input:
         # Split by various delimiters and clean up
-        import re
-        csid_list = re.split(r'[,;\n\r]+', csid_input.strip())
+        csid_list = CSID_LIST_SPLIT_RE.split(csid_input.strip())
         csids = [csid.strip() for csid in csid_list if csid.strip()]
     
     if not csids:
         return jsonify({'error': 'Please provide at least one CSID'})
     
-    wb = openpyxl.load_workbook(file)
+    track = load_workbook(session.get('session_id'), part='rows')
+    if track is None:
+        return jsonify({'error': 'Please upload an Excel file first'}), 400
+    
+    csid_set = set(csids)
     
     # IMPROVEMENT: Create a Map (dictionary) for O(1) lookup instead of nested loops
-    # Build the lookup table first by scanning all sheets once
+    # The CSID -> row map is built at upload, so only searched CSIDs are looked up
     ip_map = {}  # Dictionary: csid -> {'ip': ip_address, 'sheet': sheet_name}
     
-    # Single pass through all sheets to build the lookup map
-    for sheet_name in wb.sheetnames:
-        if sheet_name == "TRACK ODP":
-            continue
-        ws = wb[sheet_name]
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[3]:  # Check if CSID column has value
-                row_csid = str(row[3]).strip()
-                if row_csid:  # Only add non-empty CSIDs
-                    ip_map[row_csid] = {
-                        'ip': row[2] if row[2] else 'N/A',
-                        'sheet': sheet_name
-                    }
+    for search_csid in csid_set:
+        row_num = track['by_csid'].get(search_csid)
+        if row_num is not None:
+            sheet_name, row_odp, row_ip, row_csid = track['rows'][row_num]
+            ip_map[search_csid] = {
+                'ip': row_ip if row_ip else 'N/A',
+                'sheet': sheet_name
+            }
     
     # IMPROVEMENT: Fast O(1) lookup for each searched CSID
     results = []
@@ -294,17 +469,15 @@ def search_ip():
             })
             found_csids.add(search_csid)
     
-    # Add entries for CSIDs that were not found
-    not_found_csids = set(csids) - found_csids
-    for csid in not_found_csids:
-        results.append({
-            'csid': csid,
-            'ip': 'Not Found',
-            'sheet': 'N/A'
-        })
-    
-    # Sort results to show found ones first, then not found
-    results.sort(key=lambda x: (x['ip'] == 'Not Found', x['csid']))
+    # Show found ones first, then not found, each sorted by CSID; the two
+    # groups are built separately so the sort never has to tell them apart
+    results.sort(key=itemgetter('csid'))
+    not_found_csids = csid_set - found_csids
+    results.extend({
+        'csid': csid,
+        'ip': 'Not Found',
+        'sheet': 'N/A'
+    } for csid in sorted(not_found_csids))
     
     return jsonify(results)
 
@@ -313,8 +486,8 @@ def search_ip():
 def reset_file():
     """Reset the uploaded file data"""
     session_id = session.get('session_id')
-    if session_id in workbook_storage:
-        del workbook_storage[session_id]
+    if session_id is not None:
+        drop_workbook(session_id)
     return jsonify({'success': True, 'message': 'File data reset successfully'})
 
 if __name__ == '__main__':